@@ -1,6 +1,10 @@
 # config.py
 import sys
 import os
+import queue
+import atexit
+import threading
+import faulthandler
 
 # --- PFADE ---
 if os.name == 'nt':
@@ -13,7 +17,17 @@ if not os.path.exists(APP_DATA_DIR):
     os.makedirs(APP_DATA_DIR)
 
 DB_NAME = os.path.join(APP_DATA_DIR, "uff_index.db")
+# Ein Index-Shard (DB + Vektordatei) pro Ordner
+SHARD_DIR = os.path.join(APP_DATA_DIR, "shards")
+if not os.path.exists(SHARD_DIR):
+    os.makedirs(SHARD_DIR)
 LOG_FILE = os.path.join(APP_DATA_DIR, "uff.log")
+METRICS_FILE = os.path.join(APP_DATA_DIR, "uff_metrics.json")
+# Port für http://127.0.0.1:<port>/metrics (leer = aus)
+METRICS_PORT = os.getenv("UFF_METRICS_PORT")
+
+# Embedding-Modell (Snapshots sind nur mit demselben Modell kompatibel)
+MODEL_NAME = "all-MiniLM-L6-v2"
 
 def resource_path(relative_path):
     """ 
@@ -30,26 +44,76 @@ def resource_path(relative_path):
 
 # --- LOGGING KLASSE ---
 class Logger(object):
+    """
+    Gepuffertes Log: write() legt die Nachricht nur in eine Queue,
+    ein Hintergrund-Thread schreibt alle FLUSH_INTERVAL Sekunden gesammelt
+    in die Datei. So blockiert print() im Indexer nie auf Datei-I/O.
+    Tracebacks (und alles über ErrorStream) gehen sofort in die Datei,
+    bei einem Absturz wären sie sonst verloren.
+    """
+    FLUSH_INTERVAL = 0.5
+
     def __init__(self):
         self.terminal = sys.stdout
         self.log = open(LOG_FILE, "w", encoding="utf-8")
+        self.queue = queue.SimpleQueue()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._writer, daemon=True, name="LogWriter").start()
+        # Rest beim Beenden noch rausschreiben
+        atexit.register(self._drain)
+        # Segfault / Qt-abort: Python-Stack direkt in die Datei
+        faulthandler.enable(self.log)
 
     def write(self, message):
+        self.queue.put(message)
+        if "Traceback" in message:
+            self._drain()
+
+    def flush(self):
+        # Nicht blockieren, nur den Writer wecken
+        self.wakeup.set()
 
-        
-        self.log.write(message)
-        self.log.flush()
+    def _drain(self):
+        with self.lock:
+            parts = []
+            while True:
+                try: parts.append(self.queue.get_nowait())
+                except queue.Empty: break
+            if parts:
+                self.log.write("".join(parts))
+                self.log.flush()
+
+    def _writer(self):
+        while True:
+            self.wakeup.wait(self.FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self._drain()
+
+class ErrorStream(object):
+    """stderr: jede Meldung wird sofort (ungepuffert) über den Logger geschrieben."""
+    def __init__(self, logger):
+        self.logger = logger
+
+    def write(self, message):
+        self.logger.queue.put(message)
+        self.logger._drain()
 
     def flush(self):
-        self.log.flush()
+        self.logger._drain()
 
 # --- AKTIVIERUNG DES LOGGERS ---
-# Das passiert jetzt sofort beim Import dieser Datei!
-sys.stdout = Logger()
-sys.stderr = sys.stdout # Fehler auch ins Log umleiten
+def start_logging():
+    """
+    Leitet stdout/stderr ins Log um. Nur für die GUI: die Kommandozeile
+    (--health, --metrics, ...) soll das Log der letzten Sitzung nicht überschreiben.
+    """
+    logger = Logger()
+    sys.stdout = logger
+    sys.stderr = ErrorStream(logger) # Fehler auch ins Log umleiten, aber sofort
 
-print(f"--- LOGGER START ---")
-print(f"Logfile: {LOG_FILE}")
+    print(f"--- LOGGER START ---")
+    print(f"Logfile: {LOG_FILE}")
 
 
 # --- QT MESSAGE HANDLER (Filter) ---
@@ -58,7 +122,8 @@ def qt_message_handler(mode, context, message):
     ignore = ["qt.text.font", "qt.qpa.fonts", "opentype", "directwrite", "fontbbox", "script"]
     if any(k in msg_lower for k in ignore): return
     try:
-        sys.stdout.write(f"[Qt] {message}\n")
+        # Sofort schreiben, auf eine Qt-Meldung folgt evtl. ein abort()
+        sys.stderr.write(f"[Qt] {message}\n")
     except: pass
 
 # --- STYLESHEET ---
@@ -76,6 +141,7 @@ QLineEdit { padding: 10px; border: 1px solid #bdc3c7; border-radius: 20px; font-
 QLineEdit:focus { border: 2px solid #3498db; }
 QPushButton#SearchBtn { background-color: #3498db; color: white; font-weight: bold; border-radius: 20px; padding: 10px 20px; font-size: 14px; }
 QPushButton#SearchBtn:hover { background-color: #2980b9; }
+QComboBox { padding: 5px 10px; border: 1px solid #bdc3c7; border-radius: 4px; background-color: white; font-size: 13px; }
 QScrollArea { border: none; background-color: transparent; }
 QWidget#ResultsContainer { background-color: transparent; }
 """
\ No newline at end of file
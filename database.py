@@ -1,16 +1,26 @@
 # database.py
 import sqlite3
 import os
+import heapq
+import time
 import numpy as np
-import traceback 
-from sentence_transformers import util
-from rapidfuzz import fuzz
-from config import DB_NAME, APP_DATA_DIR
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_NAME, APP_DATA_DIR, SHARD_DIR
+from shard import IndexShard, file_mtime
+from metrics import metrics
+
+# Max. number of shards searched at the same time
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)
 
 class DatabaseHandler:
     """
     Handles all database operations, including initialization,
     folder management, and searching.
+
+    The main database is only the catalog of folders. Every folder has
+    its own index shard (see shard.py); searches are fanned out across
+    the shards in a thread pool and the per-shard top-k are merged.
     """
     def __init__(self):
         """
@@ -19,22 +29,102 @@ class DatabaseHandler:
         """
         self.app_data_dir = APP_DATA_DIR
         self.db_name = DB_NAME
-        self.model = None 
+        self.shard_dir = SHARD_DIR
+        self.model = None
+        self.shards = {}
+        self.pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
         self.init_db()
 
     def init_db(self):
         """
-        Initializes the database schema by creating the necessary tables
-        (documents, folders, embeddings) if they don't already exist.
+        Initializes the catalog schema (folders) if it doesn't already exist
+        and moves an old single-file index into per-folder shards.
         """
         conn = sqlite3.connect(self.db_name)
         cursor = conn.cursor()
-        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(filename, path, content);")
-        cursor.execute("CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, alias TEXT);")
-        cursor.execute("CREATE TABLE IF NOT EXISTS embeddings (doc_id INTEGER PRIMARY KEY, vec BLOB);")
+        # AUTOINCREMENT: IDs of removed folders are never reused, so a new
+        # folder can't inherit the shard files of an old one
+        cursor.execute("CREATE TABLE IF NOT EXISTS folders (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL UNIQUE, alias TEXT);")
+        self._migrate_folder_ids(cursor)
         conn.commit()
+        self._load_shards(cursor)
+        self._migrate_legacy(conn)
         conn.close()
 
+    def _migrate_folder_ids(self, cursor):
+        """
+        Gives an old catalog (folders without id column) stable folder IDs.
+
+        The old rowids become the IDs, so the existing shard files keep
+        their names.
+
+        Args:
+            cursor: The database cursor.
+        """
+        columns = [r[1] for r in cursor.execute("PRAGMA table_info(folders)").fetchall()]
+        if "id" in columns:
+            return
+        cursor.execute("CREATE TABLE folders_new (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL UNIQUE, alias TEXT);")
+        cursor.execute("INSERT INTO folders_new (id, path, alias) SELECT rowid, path, alias FROM folders")
+        cursor.execute("DROP TABLE folders")
+        cursor.execute("ALTER TABLE folders_new RENAME TO folders")
+
+    def _load_shards(self, cursor):
+        """
+        Creates the shard handles for all folders of the catalog.
+
+        Args:
+            cursor: The database cursor.
+        """
+        shards = {}
+        for fid, path in cursor.execute("SELECT id, path FROM folders").fetchall():
+            # Keep existing handles, they hold the loaded vectors
+            shard = self.shards.get(fid)
+            shards[fid] = shard if shard and shard.folder_path == path else IndexShard(fid, path, self.shard_dir)
+        self.shards = shards
+
+    def _migrate_legacy(self, conn):
+        """
+        Moves documents of the old single-file index (documents/embeddings
+        in uff_index.db) into one shard per folder and drops the old tables.
+
+        Args:
+            conn: An open connection to the main database.
+        """
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents'").fetchone():
+            return
+        print("Migrating index to per-folder shards...")
+        for shard in self.shards.values():
+            if shard.exists(): continue
+            build = shard.build_path()
+            if os.path.exists(build): os.remove(build)
+            sconn = sqlite3.connect(build)
+            IndexShard.init_schema(sconn)
+            sconn.close()
+
+            conn.execute("ATTACH DATABASE ? AS shard", (build,))
+            # Exact prefix match (like IndexShard.delete_file): "docs" must not take the files of "docs2"
+            folder = shard.folder_path.rstrip("\\/")
+            conn.execute("INSERT INTO shard.documents (rowid, filename, path, content) SELECT rowid, filename, path, content FROM main.documents WHERE path = ? OR substr(path, 1, ?) IN (?, ?)",
+                         (folder, len(folder) + 1, folder + "\\", folder + "/"))
+            conn.execute("INSERT INTO shard.documents_trigram (rowid, filename, content) SELECT rowid, filename, content FROM shard.documents")
+            conn.execute("INSERT INTO shard.embeddings (doc_id, vec) SELECT doc_id, vec FROM main.embeddings WHERE doc_id IN (SELECT rowid FROM shard.documents)")
+            rows = conn.execute("SELECT rowid, filename, path FROM shard.documents").fetchall()
+            conn.executemany("INSERT INTO shard.doc_meta (doc_id, ext, mtime) VALUES (?, ?, ?)",
+                             [(did, os.path.splitext(fname)[1].lower(), file_mtime(path)) for did, fname, path in rows])
+            conn.commit()
+            conn.execute("DETACH DATABASE shard")
+            sconn = sqlite3.connect(build)
+            IndexShard.backfill_file_state(sconn.cursor())
+            sconn.commit()
+            sconn.close()
+            shard.swap_in(build)
+
+        for table in ("documents_trigram", "documents", "embeddings", "doc_meta"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+        conn.execute("VACUUM")
+
     def add_folder(self, path):
         """
         Adds a new folder path to the database to be indexed.
@@ -47,8 +137,12 @@ class DatabaseHandler:
         """
         conn = sqlite3.connect(self.db_name)
         try:
-            conn.execute("INSERT OR IGNORE INTO folders (path, alias) VALUES (?, ?)", (path, os.path.basename(path)))
+            cursor = conn.execute("INSERT OR IGNORE INTO folders (path, alias) VALUES (?, ?)", (path, os.path.basename(path)))
             conn.commit()
+            self._load_shards(conn.cursor())
+            if cursor.rowcount:
+                # Leftovers of an old catalog must not show up in the new folder
+                self.get_shard(path).drop()
             return True
         except Exception:
             return False
@@ -57,25 +151,22 @@ class DatabaseHandler:
 
     def remove_folder(self, path):
         """
-        Removes a folder and all its associated indexed files from the database.
+        Removes a folder and its index shard from the database.
+
+        A running indexer of this folder must be stopped first, it
+        writes to the shard's build file.
 
         Args:
             path (str): The absolute path of the folder to remove.
         """
+        shard = self.get_shard(path)
         conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        # Find all document IDs associated with the folder path
-        cursor.execute("SELECT rowid FROM documents WHERE path LIKE ?", (f"{path}%",))
-        ids = [row[0] for row in cursor.fetchall()]
-        if ids:
-            # Delete documents and their embeddings
-            cursor.execute("DELETE FROM documents WHERE path LIKE ?", (f"{path}%",))
-            placeholders = ','.join('?' * len(ids))
-            cursor.execute(f"DELETE FROM embeddings WHERE doc_id IN ({placeholders})", ids)
-        # Remove the folder entry
-        cursor.execute("DELETE FROM folders WHERE path = ?", (path,))
+        conn.execute("DELETE FROM folders WHERE path = ?", (path,))
         conn.commit()
+        self._load_shards(conn.cursor())
         conn.close()
+        if shard:
+            shard.drop()
 
     def get_folders(self):
         """
@@ -89,89 +180,101 @@ class DatabaseHandler:
         conn.close()
         return [r[0] for r in rows]
 
-    def search(self, query):
+    def get_shard(self, path):
+        """
+        Returns the index shard of a folder.
+
+        Args:
+            path (str): The absolute path of the folder.
+
+        Returns:
+            IndexShard: The shard, or None if the folder is unknown.
+        """
+        return next((s for s in self.shards.values() if s.folder_path == path), None)
+
+    def invalidate(self):
+        """Drops all in-memory vectors, they get reloaded on the next search."""
+        for shard in self.shards.values():
+            shard.invalidate()
+
+    def search(self, query, limit=50, method="weighted", exts=None, folders=None,
+               modified_after=None, modified_before=None, **fusion_params):
         """
         Performs a hybrid search combining semantic and lexical (keyword) search.
 
+        Filtered-out documents are excluded before the vector scan and
+        inside the FTS queries, so narrow searches are cheaper. A folder
+        filter skips whole shards. With method="rrf" the ranks are
+        computed per shard.
+
         Args:
             query (str): The search query.
+            limit (int): Max. number of results.
+            method (str): Fusion scorer, "weighted" (default) or "rrf".
+            exts (list): Only these file extensions (e.g. [".pdf"]).
+            folders (list): Only documents from these indexed folders.
+            modified_after (float): Only files modified at/after this timestamp.
+            modified_before (float): Only files modified at/before this timestamp.
+            **fusion_params: Overrides for the scorer, e.g. alpha, beta,
+                sem_threshold, boost, rrf_k (see fusion.py).
 
         Returns:
             list: A list of search results, each containing
                   (filename, path, snippet).
         """
         # Safety check
-        if not query.strip() or not self.model: 
+        if not query.strip() or not self.model:
             return []
-        
+
+        t_search = time.perf_counter()
+        metrics.count("search.queries")
         try:
             # 1. Semantic Preparation
-            q_vec = self.model.encode(query, convert_to_tensor=False)
-            
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # Load embeddings
-            cursor.execute("SELECT doc_id, vec FROM embeddings")
-            data = cursor.fetchall()
-            doc_ids = [d[0] for d in data]
-            
-            if not doc_ids:
-                conn.close()
-                return []
-
-            # Convert BLOB -> Numpy Array
-            # This can fail if the DB is corrupt or dimensions mismatch
-            vecs = np.array([np.frombuffer(d[1], dtype=np.float32) for d in data])
-            
-            # Calculate Cosine Similarity
-            scores = util.cos_sim(q_vec, vecs)[0].numpy()
-            scores = np.clip(scores, 0, 1)
-            sem_map = {did: float(s) for did, s in zip(doc_ids, scores)}
-
-            # 2. Lexical Search (FTS)
-            words = query.replace('"', '').split()
-            if not words: words = [query]
-            fts_query = " OR ".join([f'"{w}"*' for w in words])
-            
-            try:
-                fts_rows = cursor.execute("SELECT rowid, filename, content FROM documents WHERE documents MATCH ? LIMIT 100", (fts_query,)).fetchall()
-            except Exception as e:
-                print(f"FTS Error (ignored): {e}")
-                fts_rows = []
-
-            lex_map = {}
-            for did, fname, content in fts_rows:
-                r1 = fuzz.partial_ratio(query.lower(), fname.lower())
-                # Truncate content for performance
-                r2 = fuzz.partial_token_set_ratio(query.lower(), content[:5000].lower())
-                lex_map[did] = max(r1, r2) / 100.0
-
-            # 3. Hybrid Fusion
-            final = {}
-            ALPHA = 0.65  # Weight for semantic score
-            BETA = 0.35   # Weight for lexical score
-            for did, s_score in sem_map.items():
-                if s_score < 0.15 and did not in lex_map: continue
-                l_score = lex_map.get(did, 0.0)
-                h_score = (s_score * ALPHA) + (l_score * BETA)
-                # Small boost if both scores are good
-                if s_score > 0.4 and l_score > 0.6: h_score += 0.1
-                final[did] = h_score
+            with metrics.timer("search.encode"):
+                q_vec = np.asarray(self.model.encode(query, convert_to_tensor=False), dtype=np.float32)
+                q_vec /= max(float(np.linalg.norm(q_vec)), 1e-12)
+
+            shards = [s for s in self.shards.values() if folders is None or s.folder_path in folders]
+            if exts is not None: exts = [e.lower() for e in exts]
+
+            # 2. Fan out: semantic + lexical stage per shard
+            t0 = time.perf_counter()
+            futures = [
+                (shard, self.pool.submit(shard.search, q_vec, query, limit, method, exts,
+                                         modified_after, modified_before, fusion_params))
+                for shard in shards
+            ]
+            hits = []
+            for shard, future in futures:
+                try:
+                    hits.extend((score, shard.folder_id, did) for score, did in future.result())
+                except Exception as e:
+                    print(f"Shard Error (ignored): {shard.folder_path}: {e}")
+                    print(traceback.format_exc())
+
+            # 3. Merge the per-shard top-k
+            best = heapq.nlargest(limit, hits)
+            metrics.observe("search.shards", time.perf_counter() - t0)
 
             # 4. Fetch Results
-            sorted_ids = sorted(final.keys(), key=lambda x: final[x], reverse=True)[:50]
-            results = []
-            for did in sorted_ids:
-                row = cursor.execute("SELECT filename, path, snippet(documents, 2, '<b>', '</b>', '...', 15) FROM documents WHERE rowid = ?", (did,)).fetchone()
-                if row: results.append(row)
-            
-            conn.close()
-            return results
+            t0 = time.perf_counter()
+            wanted = {}
+            for _, fid, did in best:
+                wanted.setdefault(fid, []).append(did)
+            rows = {}
+            for fid, dids in wanted.items():
+                try:
+                    for did, row in self.shards[fid].fetch(dids).items():
+                        rows[(fid, did)] = row
+                except Exception as e:
+                    print(f"Shard Error (ignored): {self.shards[fid].folder_path}: {e}")
+            metrics.observe("search.snippets", time.perf_counter() - t0)
+            metrics.observe("search.total", time.perf_counter() - t_search)
+            return [rows[(fid, did)] for _, fid, did in best if (fid, did) in rows]
 
         except Exception as e:
             # NEW: This part writes the error to the log file
             print(f"!!! CRITICAL ERROR IN SEARCH !!!")
             print(f"Error: {e}")
             print(traceback.format_exc())
-            return []
\ No newline at end of file
+            return []
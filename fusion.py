@@ -0,0 +1,117 @@
+# fusion.py
+import numpy as np
+
+# --- DEFAULTS (Hybrid Fusion) ---
+ALPHA = 0.65          # Weight for semantic score
+BETA = 0.35           # Weight for lexical score
+SEM_THRESHOLD = 0.15  # Min. semantic score for documents without a lexical hit
+BOOST = 0.1           # Small boost if both scores are good ...
+BOOST_SEM = 0.4       # ... i.e. semantic score above this
+BOOST_LEX = 0.6       # ... and lexical score above this
+RRF_K = 60            # Damping constant for reciprocal-rank fusion
+
+def scatter_lexical(doc_ids, lex_map):
+    """
+    Scatters lexical scores into a vector aligned with the semantic scores.
+
+    Args:
+        doc_ids (np.ndarray): Sorted document IDs of the semantic vector.
+        lex_map (dict): Mapping doc_id -> lexical score (0..1).
+
+    Returns:
+        tuple: (lex_scores, has_lex) - float32 scores and a bool mask of
+               documents with a lexical hit. IDs without embedding are dropped.
+    """
+    lex_scores = np.zeros(len(doc_ids), dtype=np.float32)
+    has_lex = np.zeros(len(doc_ids), dtype=bool)
+    if not lex_map or not len(doc_ids):
+        return lex_scores, has_lex
+
+    ids = np.fromiter(lex_map.keys(), dtype=np.int64, count=len(lex_map))
+    vals = np.fromiter(lex_map.values(), dtype=np.float32, count=len(lex_map))
+    pos = np.searchsorted(doc_ids, ids)
+    pos = np.clip(pos, 0, len(doc_ids) - 1)
+    found = doc_ids[pos] == ids
+    lex_scores[pos[found]] = vals[found]
+    has_lex[pos[found]] = True
+    return lex_scores, has_lex
+
+def weighted_fusion(sem_scores, lex_scores, has_lex, alpha=ALPHA, beta=BETA,
+                    sem_threshold=SEM_THRESHOLD, boost=BOOST,
+                    boost_sem=BOOST_SEM, boost_lex=BOOST_LEX):
+    """
+    Linear combination of semantic and lexical scores.
+
+    Returns:
+        np.ndarray: Hybrid scores, -inf for documents that are filtered out.
+    """
+    fused = sem_scores * alpha + lex_scores * beta
+    fused += np.where((sem_scores > boost_sem) & (lex_scores > boost_lex), boost, 0.0).astype(fused.dtype)
+    keep = (sem_scores >= sem_threshold) | has_lex
+    return np.where(keep, fused, -np.inf)
+
+def rrf_fusion(sem_scores, lex_scores, has_lex, rrf_k=RRF_K,
+               sem_threshold=SEM_THRESHOLD):
+    """
+    Reciprocal-rank fusion: sum of 1 / (rrf_k + rank) over both result lists.
+
+    Only the ranks matter, so it is robust against differently scaled scores.
+
+    Returns:
+        np.ndarray: RRF scores, -inf for documents in neither list.
+    """
+    fused = np.zeros(len(sem_scores), dtype=np.float64)
+
+    sem_idx = np.flatnonzero(sem_scores >= sem_threshold)
+    sem_order = sem_idx[np.argsort(-sem_scores[sem_idx], kind="stable")]
+    fused[sem_order] += 1.0 / (rrf_k + np.arange(1, len(sem_order) + 1))
+
+    lex_idx = np.flatnonzero(has_lex)
+    lex_order = lex_idx[np.argsort(-lex_scores[lex_idx], kind="stable")]
+    fused[lex_order] += 1.0 / (rrf_k + np.arange(1, len(lex_order) + 1))
+
+    keep = (sem_scores >= sem_threshold) | has_lex
+    return np.where(keep, fused, -np.inf)
+
+FUSION_METHODS = {
+    "weighted": weighted_fusion,
+    "rrf": rrf_fusion,
+}
+
+def top_k(scores, k):
+    """
+    Returns the indices of the k best scores, best first.
+
+    Uses argpartition, so only the k winners get sorted.
+    Entries with -inf are never returned.
+    """
+    valid = int(np.count_nonzero(np.isfinite(scores)))
+    k = min(k, valid)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def fuse(sem_scores, lex_scores, has_lex, k=50, method="weighted", **params):
+    """
+    Runs the selected fusion scorer and selects the top-k documents.
+
+    Args:
+        sem_scores (np.ndarray): Semantic scores (0..1) per document.
+        lex_scores (np.ndarray): Lexical scores (0..1) per document.
+        has_lex (np.ndarray): Bool mask of documents with a lexical hit.
+        k (int): Number of results.
+        method (str): "weighted" (default) or "rrf".
+        **params: Passed to the scorer (alpha, beta, sem_threshold, rrf_k, ...).
+
+    Returns:
+        tuple: (indices, scores) of the top-k documents, best first.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    fused = FUSION_METHODS[method](sem_scores, lex_scores, has_lex, **params)
+    idx = top_k(fused, k)
+    return idx, fused[idx]
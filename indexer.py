@@ -4,7 +4,11 @@ import sqlite3
 import pdfplumber
 import zipfile
 import io
+import time
+import traceback
 from PyQt6.QtCore import QThread, pyqtSignal
+from shard import IndexShard
+from metrics import metrics
 
 # Optional library imports
 try: import docx
@@ -14,33 +18,187 @@ except ImportError: openpyxl = None
 try: from pptx import Presentation
 except ImportError: Presentation = None
 
+# Plain text formats that are read directly
+TEXT_EXTENSIONS = [".txt", ".md", ".py", ".json", ".csv", ".html", ".log", ".ini", ".xml"]
+
+# Network shares report mtimes with different precision depending on the client
+MTIME_TOLERANCE = 1.0
+
+# Min. seconds between two progress signals, so the UI thread is never flooded
+PROGRESS_INTERVAL = 0.2
+
+def prescan(folder, is_running=lambda: True):
+    """
+    Lists all files below a folder with os.scandir.
+
+    scandir delivers the file attributes together with the directory
+    listing (on Windows without an extra stat call per file), which makes
+    this much cheaper than os.walk + os.stat.
+
+    Args:
+        folder (str): The folder to scan.
+        is_running (callable): Returns False to abort the scan.
+
+    Returns:
+        tuple: (files, per_type) - files is a list of (path, name, size, mtime),
+               per_type maps extension -> [file count, bytes].
+    """
+    files, per_type = [], {}
+    stack = [folder]
+    while stack and is_running():
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            continue
+        subdirs = []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file(): continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.path, entry.name, st.st_size, st.st_mtime))
+                t = per_type.setdefault(os.path.splitext(entry.name)[1].lower(), [0, 0])
+                t[0] += 1
+                t[1] += st.st_size
+        # Depth-first in listing order, like os.walk
+        stack.extend(reversed(subdirs))
+    return files, per_type
+
+def format_duration(seconds):
+    """Formats seconds as short German text, e.g. "3 min 20 s"."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} h {seconds % 3600 // 60:02d} min"
+    if seconds >= 60:
+        return f"{seconds // 60} min {seconds % 60:02d} s"
+    return f"{seconds} s"
+
+class ProgressTracker:
+    """
+    Percentage, throughput and ETA of an indexer run, based on the
+    totals of the pre-scan.
+
+    The ETA uses the measured time per file of each file type, because
+    a PDF costs far more than a text file.
+    """
+    def __init__(self, per_type):
+        """
+        Args:
+            per_type (dict): extension -> [file count, bytes] from prescan().
+        """
+        self.total_files = sum(c for c, _ in per_type.values())
+        self.total_bytes = sum(b for _, b in per_type.values())
+        self.remaining = {ext: c for ext, (c, _) in per_type.items()}
+        self.spent = {}  # ext -> [seconds, files]
+        self.done_files = 0
+        self.done_bytes = 0
+        self.started = time.perf_counter()
+
+    def advance(self, ext, size, seconds=None):
+        """
+        Marks one file as done.
+
+        Args:
+            ext (str): The file extension.
+            size (int): The file size in bytes.
+            seconds (float): Processing time, None for files that were skipped unchanged.
+        """
+        self.done_files += 1
+        self.done_bytes += size
+        self.remaining[ext] = self.remaining.get(ext, 0) - 1
+        if seconds is not None:
+            s = self.spent.setdefault(ext, [0.0, 0])
+            s[0] += seconds
+            s[1] += 1
+
+    def percent(self):
+        """Returns the progress in percent (by files)."""
+        if not self.total_files:
+            return 100
+        return min(100, int(self.done_files * 100 / self.total_files))
+
+    def eta(self):
+        """Returns the estimated remaining seconds, or None before the first measurement."""
+        total_s = sum(s for s, _ in self.spent.values())
+        total_n = sum(n for _, n in self.spent.values())
+        if not total_n:
+            return None
+        default = total_s / total_n
+        eta = 0.0
+        for ext, left in self.remaining.items():
+            if left <= 0: continue
+            s, n = self.spent.get(ext, (0.0, 0))
+            eta += left * (s / n if n else default)
+        return eta
+
+    def status(self, current=""):
+        """Returns the status line for the UI."""
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        text = (f"{self.done_files}/{self.total_files} Dateien ({self.percent()}%) · "
+                f"{self.done_files / elapsed:.1f} Dateien/s · {self.done_bytes / elapsed / 1048576:.1f} MB/s")
+        eta = self.eta()
+        if eta is not None:
+            text += f" · noch ca. {format_duration(eta)}"
+        if current:
+            text += f" · {current}"
+        return text
+
 class IndexerThread(QThread):
     """
     A QThread that indexes files in a given folder, extracts their text content,
     and stores it in a database along with semantic embeddings.
+
+    The folder's shard is rebuilt in a separate file and swapped in when
+    indexing is complete, so searches keep using the old shard meanwhile.
+    In incremental mode only new, changed and deleted files are processed.
     """
     progress_signal = pyqtSignal(str)
+    percent_signal = pyqtSignal(int)
     finished_signal = pyqtSignal(int, int, bool)
 
-    def __init__(self, folder, db_name, model):
+    def __init__(self, shard, model, incremental=False):
         """
         Initializes the IndexerThread.
 
         Args:
-            folder (str): The path to the folder to be indexed.
-            db_name (str): The name of the SQLite database file.
+            shard (IndexShard): The shard of the folder to be indexed.
             model: The sentence-transformer model for creating embeddings.
+            incremental (bool): Update the existing shard instead of a full rebuild.
         """
         super().__init__()
-        self.folder_path = folder
-        self.db_name = db_name
+        self.shard = shard
+        self.folder_path = shard.folder_path
         self.model = model
+        self.incremental = incremental
         self.is_running = True
+        self._last_report = 0.0
 
     def stop(self):
         """Stops the indexing process."""
         self.is_running = False
 
+    def _report(self, tracker, current="", force=False):
+        """
+        Emits progress, at most every PROGRESS_INTERVAL seconds.
+
+        Args:
+            tracker (ProgressTracker): The progress of the run.
+            current (str): Name of the current file.
+            force (bool): Emit regardless of the rate limit.
+        """
+        now = time.perf_counter()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        self.progress_signal.emit(tracker.status(current))
+        self.percent_signal.emit(tracker.percent())
+
     def _extract_text(self, stream, filename):
         """
         Extracts text from a file stream based on its extension.
@@ -54,6 +212,7 @@ class IndexerThread(QThread):
         """
         ext = os.path.splitext(filename)[1].lower()
         text = ""
+        t0 = time.perf_counter()
         try:
             if ext == ".pdf":
                 try:
@@ -94,7 +253,7 @@ class IndexerThread(QThread):
                 except Exception:
                     pass
 
-            elif ext in [".txt", ".md", ".py", ".json", ".csv", ".html", ".log", ".ini", ".xml"]:
+            elif ext in TEXT_EXTENSIONS:
                 try:
                     content = stream.read()
                     if isinstance(content, str): text = content
@@ -103,43 +262,91 @@ class IndexerThread(QThread):
                     pass
         except Exception:
             pass
+        metrics.observe(f"index.extract{ext or '.none'}", time.perf_counter() - t0)
         return text
 
     def run(self):
         """
         Starts the indexing process.
         
-        Iterates through files in the specified folder, extracts text,
-        and saves it to the database. Emits progress and finished signals.
+        Lists the files of the folder (pre-scan), extracts text,
+        and saves it to a fresh shard database (incremental mode: to an
+        updated copy of the old one). Emits progress and finished signals.
+        finished_signal is always emitted; a failed run counts as cancelled
+        and leaves the old shard untouched.
         """
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        # Cleanup old entries for the folder
-        cursor.execute("SELECT rowid FROM documents WHERE path LIKE ?", (f"{self.folder_path}%",))
-        ids = [r[0] for r in cursor.fetchall()]
-        if ids:
-            cursor.execute("DELETE FROM documents WHERE path LIKE ?", (f"{self.folder_path}%",))
-            placeholders = ','.join('?' * len(ids))
-            cursor.execute(f"DELETE FROM embeddings WHERE doc_id IN ({placeholders})", ids)
-            conn.commit()
-
-        indexed = 0
-        skipped = 0
-        cancelled = False
-
-        for root, dirs, files in os.walk(self.folder_path):
-            if not self.is_running:
-                cancelled = True
-                break
-            for file in files:
+        t_run = time.perf_counter()
+        try:
+            indexed, skipped, cancelled = self._build()
+        except Exception as e:
+            print(f"Indexer failed: {self.folder_path}: {e}")
+            print(traceback.format_exc())
+            indexed, skipped, cancelled = 0, 0, True
+            for path in (self.shard.build_path(), self.shard.vec_path + ".build"):
+                try:
+                    if os.path.exists(path): os.remove(path)
+                except OSError:
+                    pass
+        metrics.observe("index.run", time.perf_counter() - t_run)
+        self.finished_signal.emit(indexed, skipped, cancelled)
+
+    def _build(self):
+        """
+        Builds the new shard and swaps it in (see run).
+
+        Returns:
+            tuple: (indexed, skipped, cancelled)
+        """
+        # Build the new shard next to the old one
+        build = self.shard.build_path()
+        if os.path.exists(build): os.remove(build)
+        incremental = self.incremental and self.shard.exists()
+        if incremental:
+            self.shard.copy_to(build)
+        conn = sqlite3.connect(build)
+        try:
+            IndexShard.init_schema(conn)
+            cursor = conn.cursor()
+
+            # Known files of the old shard (only used in incremental mode)
+            known = {}
+            if incremental:
+                IndexShard.backfill_file_state(cursor)
+                known = {p: (size, mtime) for p, size, mtime in cursor.execute("SELECT path, size, mtime FROM file_state")}
+            seen = set()
+
+            # Pre-scan: totals for percentage and ETA
+            self.progress_signal.emit("Zähle Dateien...")
+            with metrics.timer("index.prescan"):
+                files, per_type = prescan(self.folder_path, lambda: self.is_running)
+            top = sorted(per_type.items(), key=lambda t: t[1][1], reverse=True)[:5]
+            print(f"Prescan {self.folder_path}: {len(files)} files, " + ", ".join(f"{ext or '-'}: {c} ({b / 1048576:.1f} MB)" for ext, (c, b) in top))
+            tracker = ProgressTracker(per_type)
+
+            indexed = 0
+            skipped = 0
+            cancelled = not self.is_running
+
+            for path, file, fsize, fmtime in files:
                 if not self.is_running:
                     cancelled = True
                     break
-                path = os.path.join(root, file)
-                self.progress_signal.emit(f"Checking: {file}...")
+                ext = os.path.splitext(file)[1].lower()
+                seen.add(path)
+                if path in known:
+                    size, mtime = known[path]
+                    if size == fsize and mtime is not None and abs(mtime - fmtime) <= MTIME_TOLERANCE:
+                        metrics.count("index.files_unchanged")
+                        tracker.advance(ext, fsize)
+                        self._report(tracker)
+                        continue
+                    IndexShard.delete_file(cursor, path)
+                metrics.count("index.files")
+                metrics.count("index.bytes", fsize)
+                self._report(tracker, file)
+                t0 = time.perf_counter()
 
-                if file.lower().endswith('.zip'):
+                if ext == '.zip':
                     try:
                         with zipfile.ZipFile(path, 'r') as z:
                             for zi in z.infolist():
@@ -148,7 +355,8 @@ class IndexerThread(QThread):
                                 with z.open(zi) as zf:
                                     content = self._extract_text(io.BytesIO(zf.read()), zi.filename)
                                     if content and len(content.strip()) > 20:
-                                        self._save(cursor, zi.filename, vpath, content)
+                                        mtime = time.mktime(zi.date_time + (0, 0, -1))
+                                        self._save(cursor, zi.filename, vpath, content, mtime)
                                         indexed += 1
                     except Exception:
                         skipped += 1
@@ -158,32 +366,55 @@ class IndexerThread(QThread):
                             file_content = io.BytesIO(f.read())
                             content = self._extract_text(file_content, file)
                         if content and len(content.strip()) > 20:
-                            self._save(cursor, file, path, content)
+                            self._save(cursor, file, path, content, fmtime)
                             indexed += 1
                         else:
                             skipped += 1
                     except Exception:
                         skipped += 1
+                cursor.execute("INSERT OR REPLACE INTO file_state (path, size, mtime) VALUES (?, ?, ?)", (path, fsize, fmtime))
+                tracker.advance(ext, fsize, time.perf_counter() - t0)
 
-            if cancelled:
-                break
+            if not cancelled:
+                self._report(tracker, force=True)
+                # Files that disappeared since the last scan
+                for path in known.keys() - seen:
+                    IndexShard.delete_file(cursor, path)
+                    cursor.execute("DELETE FROM file_state WHERE path = ?", (path,))
+                cursor.execute("DELETE FROM shard_info WHERE key = 'needs_catchup'")
         
-        conn.commit()
-        conn.close()
-        self.finished_signal.emit(indexed, skipped, cancelled)
+            with metrics.timer("index.db_commit"):
+                conn.commit()
+        finally:
+            conn.close()
+        if cancelled:
+            # Keep the old shard untouched
+            os.remove(build)
+        else:
+            with metrics.timer("index.swap_in"):
+                self.shard.swap_in(build)
+        metrics.count("index.skipped", skipped)
+        return indexed, skipped, cancelled
 
-    def _save(self, cursor, fname, path, content):
+    def _save(self, cursor, fname, path, content, mtime):
         """
-        Saves the extracted content and its embedding to the database.
+        Saves the extracted content, its attributes and its embedding to the database.
 
         Args:
             cursor: The database cursor.
             fname (str): The name of the file.
             path (str): The full path to the file.
             content (str): The extracted text content.
+            mtime (float): The modification time of the file.
         """
-        cursor.execute("INSERT INTO documents (filename, path, content) VALUES (?, ?, ?)", (fname, path, content))
-        did = cursor.lastrowid
         # Truncate content for embedding to avoid excessive memory usage
-        vec = self.model.encode(content[:8000], convert_to_tensor=False).tobytes()
-        cursor.execute("INSERT INTO embeddings (doc_id, vec) VALUES (?, ?)", (did, vec))
\ No newline at end of file
+        with metrics.timer("index.embed"):
+            vec = self.model.encode(content[:8000], convert_to_tensor=False).tobytes()
+        with metrics.timer("index.db_write"):
+            cursor.execute("INSERT INTO documents (filename, path, content) VALUES (?, ?, ?)", (fname, path, content))
+            did = cursor.lastrowid
+            cursor.execute("INSERT INTO documents_trigram (rowid, filename, content) VALUES (?, ?, ?)", (did, fname, content))
+            ext = os.path.splitext(fname)[1].lower()
+            cursor.execute("INSERT INTO doc_meta (doc_id, ext, mtime) VALUES (?, ?, ?)", (did, ext, mtime))
+            cursor.execute("INSERT INTO embeddings (doc_id, vec) VALUES (?, ?)", (did, vec))
+        metrics.count("index.docs")
@@ -2,19 +2,94 @@
 import sys
 import os
 import time
+import json
+import atexit
+import argparse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="UFF Search")
+    parser.add_argument("--export-snapshot", metavar="FILE", help="Index als Snapshot exportieren und beenden")
+    parser.add_argument("--import-snapshot", metavar="FILE", help="Snapshot importieren und beenden")
+    parser.add_argument("--remap", metavar="ALT=NEU", action="append", default=[],
+                        help="Pfad-Präfix beim Import umschreiben (mehrfach möglich)")
+    parser.add_argument("--metrics", action="store_true", help="Messwerte der letzten Sitzung ausgeben und beenden")
+    parser.add_argument("--health", action="store_true", help="Zustand des Index als JSON ausgeben und beenden")
+    parser.add_argument("--maintain", action="store_true", help="Index komplett warten (Reparatur, Merge, Vacuum) und beenden")
+    # Qt-eigene Argumente (z.B. -platform) durchlassen
+    return parser.parse_known_args()[0]
+
+def is_cli(args):
+    return bool(args.export_snapshot or args.import_snapshot or args.metrics or args.health or args.maintain)
+
+# Argumente zuerst: im Kommandozeilen-Modus bleibt das GUI-Log unangetastet
+ARGS = parse_args()
+
+# Config zuerst!
+from config import start_logging, qt_message_handler, LOG_FILE, resource_path, METRICS_FILE, METRICS_PORT
+if not is_cli(ARGS):
+    start_logging()
+
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtGui import QPixmap, QFont, QIcon
 from PyQt6.QtCore import qInstallMessageHandler, QTimer, Qt
-
-# Config zuerst!
-from config import qt_message_handler, LOG_FILE, resource_path
+from metrics import metrics, start_http_server
 
 from ui import UffWindow, ModernSplashScreen, ModelLoaderThread
 
 qInstallMessageHandler(qt_message_handler)
 os.environ["QT_LOGGING_RULES"] = "qt.text.font.db=false;qt.qpa.fonts=false"
 
+def run_cli(args):
+    """
+    Kommandozeilen-Modus ohne GUI: Snapshot Export/Import, Messwerte (--metrics),
+    Index-Zustand (--health) und Wartung (--maintain). Die Ausgabe geht auf die
+    Konsole, das Log der GUI wird nicht angefasst.
+    """
+    from database import DatabaseHandler
+    from snapshot import export_snapshot, import_snapshot, parse_remap
+    from maintenance import maintain, index_health
+    out = sys.__stdout__
+    if args.metrics:
+        if not os.path.exists(METRICS_FILE):
+            print("No metrics recorded yet.", file=out)
+            return 1
+        with open(METRICS_FILE, encoding="utf-8") as f:
+            out.write(f.read() + "\n")
+        return 0
+    try:
+        db = DatabaseHandler()
+        if args.export_snapshot:
+            n = export_snapshot(db, args.export_snapshot)
+            print(f"Exported {n} folder(s) to {args.export_snapshot}", file=out)
+        if args.import_snapshot:
+            remaps = [parse_remap(r) for r in args.remap]
+            for folder in import_snapshot(db, args.import_snapshot, remaps):
+                print(f"Imported {folder}", file=out)
+            print("The changes since the snapshot are indexed on the next start.", file=out)
+        if args.maintain:
+            for folder, step in maintain(db, steps=["repair", "merge", "vacuum"]):
+                print(f"{step}: {folder}", file=out)
+        if args.health:
+            print(json.dumps(index_health(db), indent=2), file=out)
+        return 0
+    except Exception as e:
+        print(f"Error: {e}", file=sys.__stderr__)
+        return 1
+
 if __name__ == "__main__":
+    args = ARGS
+    if is_cli(args):
+        sys.exit(run_cli(args))
+
+    # Messwerte beim Beenden sichern (für --metrics), optional live per HTTP
+    atexit.register(metrics.dump, METRICS_FILE)
+    if METRICS_PORT:
+        try:
+            start_http_server(int(METRICS_PORT))
+            print(f"Metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+        except (OSError, ValueError) as e:
+            print(f"Metrics server not started: {e}")
+
     try:
         app = QApplication(sys.argv)
         app.setFont(QFont("Segoe UI", 10))
@@ -0,0 +1,299 @@
+# maintenance.py
+import os
+import sqlite3
+from shard import file_mtime
+from metrics import metrics
+
+# FTS5 segments per table above which an incremental merge is worth it
+SEGMENT_THRESHOLD = 8
+# Max. pages written per 'merge' step, keeps a single step short
+MERGE_PAGES = 500
+# Share of free pages above which the shard gets vacuumed
+FRAGMENTATION_THRESHOLD = 0.2
+# Documents re-embedded per transaction, keeps the write lock short for searches
+REPAIR_BATCH = 50
+# SQLite VM steps between two checks whether maintenance has to stop
+INTERRUPT_CHECK_OPS = 1000
+
+def _connect(path, is_running):
+    """Opens a connection whose statements abort (sqlite3.OperationalError) once is_running() is False."""
+    conn = sqlite3.connect(path)
+    conn.set_progress_handler(lambda: not is_running(), INTERRUPT_CHECK_OPS)
+    return conn
+
+def shard_health(shard):
+    """
+    Collects size and consistency statistics of one shard.
+
+    Args:
+        shard (IndexShard): The shard to inspect.
+
+    Returns:
+        dict: folder, docs, vectors, orphaned_embeddings, missing_embeddings,
+              missing_meta, db_bytes, vector_bytes, pages, free_pages,
+              fragmentation, fts_segments, trigram_segments.
+    """
+    health = {"folder": shard.folder_path, "exists": shard.exists()}
+    if not shard.exists():
+        return health
+    conn = sqlite3.connect(shard.db_path)
+    try:
+        q = lambda sql: conn.execute(sql).fetchone()[0]
+        pages = q("PRAGMA page_count")
+        free = q("PRAGMA freelist_count")
+        health.update({
+            "docs": q("SELECT COUNT(*) FROM documents"),
+            "vectors": q("SELECT COUNT(*) FROM embeddings"),
+            "orphaned_embeddings": q("SELECT COUNT(*) FROM embeddings WHERE doc_id NOT IN (SELECT rowid FROM documents)"),
+            "missing_embeddings": q("SELECT COUNT(*) FROM documents WHERE rowid NOT IN (SELECT doc_id FROM embeddings)"),
+            "missing_meta": q("SELECT COUNT(*) FROM documents WHERE rowid NOT IN (SELECT doc_id FROM doc_meta)"),
+            "db_bytes": os.path.getsize(shard.db_path),
+            "vector_bytes": os.path.getsize(shard.vec_path) if os.path.exists(shard.vec_path) else 0,
+            "pages": pages,
+            "free_pages": free,
+            "fragmentation": round(free / pages, 3) if pages else 0.0,
+            "fts_segments": q("SELECT COUNT(DISTINCT segid) FROM documents_idx"),
+            "trigram_segments": q("SELECT COUNT(DISTINCT segid) FROM documents_trigram_idx"),
+        })
+    finally:
+        conn.close()
+    return health
+
+def index_health(db):
+    """
+    Collects the health of all shards plus totals.
+
+    Args:
+        db (DatabaseHandler): The index.
+
+    Returns:
+        dict: shards (list of shard_health dicts) and totals.
+    """
+    shards = [shard_health(s) for s in db.shards.values()]
+    keys = ("docs", "vectors", "orphaned_embeddings", "missing_embeddings", "missing_meta", "db_bytes", "vector_bytes")
+    totals = {k: sum(h.get(k, 0) for h in shards) for k in keys}
+    totals["catalog_bytes"] = os.path.getsize(db.db_name) if os.path.exists(db.db_name) else 0
+    return {"shards": shards, "totals": totals}
+
+def needs_maintenance(health):
+    """
+    Decides which maintenance steps a shard needs.
+
+    Args:
+        health (dict): Result of shard_health().
+
+    Returns:
+        list: Subset of ["repair", "merge", "vacuum"].
+    """
+    if not health.get("exists"):
+        return []
+    steps = []
+    if health["orphaned_embeddings"] or health["missing_embeddings"] or health["missing_meta"]:
+        steps.append("repair")
+    if max(health["fts_segments"], health["trigram_segments"]) > SEGMENT_THRESHOLD:
+        steps.append("merge")
+    if health["fragmentation"] > FRAGMENTATION_THRESHOLD:
+        steps.append("vacuum")
+    return steps
+
+def repair(shard, model=None, is_running=lambda: True):
+    """
+    Fixes inconsistencies between documents, embeddings and doc_meta.
+
+    Orphaned embeddings/attributes are deleted. Documents without embedding
+    are embedded again if a model is given, otherwise removed (they can't be
+    found by the search anyway and come back with the next scan). Works on
+    the live shard in short transactions; when stopped, the rows fixed so
+    far are kept.
+
+    Args:
+        shard (IndexShard): The shard to repair.
+        model: Optional sentence-transformer model.
+        is_running (callable): Returns False to stop.
+
+    Returns:
+        int: Number of fixed rows.
+    """
+    conn = _connect(shard.db_path, is_running)
+    fixed = 0      # rows changed
+    committed = 0  # ... and already committed
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM embeddings WHERE doc_id NOT IN (SELECT rowid FROM documents)")
+        fixed += cursor.rowcount
+        cursor.execute("DELETE FROM doc_meta WHERE doc_id NOT IN (SELECT rowid FROM documents)")
+        fixed += cursor.rowcount
+
+        rows = cursor.execute("SELECT rowid, filename, path FROM documents WHERE rowid NOT IN (SELECT doc_id FROM doc_meta)").fetchall()
+        cursor.executemany("INSERT INTO doc_meta (doc_id, ext, mtime) VALUES (?, ?, ?)",
+                           [(did, os.path.splitext(fname)[1].lower(), file_mtime(path)) for did, fname, path in rows])
+        fixed += len(rows)
+        conn.commit()
+        committed = fixed
+
+        rows = cursor.execute("SELECT rowid, filename, path, content FROM documents WHERE rowid NOT IN (SELECT doc_id FROM embeddings)").fetchall()
+        # Older shards have no file_state yet (backfilled by the next incremental scan)
+        has_state = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'file_state'").fetchone()
+        for i, (did, fname, path, content) in enumerate(rows):
+            if not is_running(): break
+            if i and i % REPAIR_BATCH == 0:
+                conn.commit()
+                committed = fixed
+            if model:
+                # Same truncation as the indexer
+                vec = model.encode(content[:8000], convert_to_tensor=False).tobytes()
+                cursor.execute("INSERT INTO embeddings (doc_id, vec) VALUES (?, ?)", (did, vec))
+            else:
+                cursor.execute("INSERT INTO documents_trigram (documents_trigram, rowid, filename, content) VALUES ('delete', ?, ?, ?)", (did, fname, content))
+                cursor.execute("DELETE FROM documents WHERE rowid = ?", (did,))
+                cursor.execute("DELETE FROM doc_meta WHERE doc_id = ?", (did,))
+                # Mark the file as changed, so the next (incremental) scan indexes it again.
+                # Not deleted: for archives the other members must be replaced, not duplicated.
+                if has_state:
+                    cursor.execute("UPDATE file_state SET mtime = NULL WHERE path = ?", (path.split(" :: ")[0],))
+            fixed += 1
+        conn.commit()
+        committed = fixed
+    finally:
+        conn.rollback()
+        if committed:
+            # Also after an abort: the vector file must match what was committed
+            conn.set_progress_handler(None, 0)
+            shard.refresh_vectors(conn)
+        conn.close()
+    return committed
+
+def merge_step(shard, pages=MERGE_PAGES, is_running=lambda: True):
+    """
+    Runs one incremental FTS5 merge step on both full-text tables.
+
+    A step writes at most `pages` pages, so searches on the live shard
+    only wait for a short commit.
+
+    Args:
+        shard (IndexShard): The shard.
+        pages (int): Max. pages to write per table.
+        is_running (callable): Returns False to abort the step.
+
+    Returns:
+        bool: True if the step reduced the number of segments (call again).
+    """
+    # total_changes can't tell if 'merge' did any work, the segment count can
+    segments = "SELECT (SELECT COUNT(DISTINCT segid) FROM documents_idx) + (SELECT COUNT(DISTINCT segid) FROM documents_trigram_idx)"
+    conn = _connect(shard.db_path, is_running)
+    try:
+        before = conn.execute(segments).fetchone()[0]
+        conn.execute("INSERT INTO documents (documents, rank) VALUES ('merge', ?)", (pages,))
+        conn.execute("INSERT INTO documents_trigram (documents_trigram, rank) VALUES ('merge', ?)", (pages,))
+        conn.commit()
+        after = conn.execute(segments).fetchone()[0]
+        return 2 < after < before
+    finally:
+        conn.close()
+
+def compact(shard, is_running=lambda: True):
+    """
+    Fully optimizes a shard: FTS5 optimize, VACUUM and query-planner statistics.
+
+    The work is done on a copy (build file) that is swapped in at the end
+    like a rebuilt shard, so searches never wait for the exclusive locks
+    of optimize/VACUUM. If stopped, the copy is discarded.
+
+    Args:
+        shard (IndexShard): The shard.
+        is_running (callable): Returns False to abort.
+    """
+    build = shard.build_path()
+    if os.path.exists(build): os.remove(build)
+    try:
+        conn = _connect(shard.db_path, is_running)
+        try:
+            conn.execute("VACUUM INTO ?", (build,))
+        finally:
+            conn.close()
+        conn = _connect(build, is_running)
+        try:
+            conn.execute("INSERT INTO documents (documents) VALUES ('optimize')")
+            conn.execute("INSERT INTO documents_trigram (documents_trigram) VALUES ('optimize')")
+            conn.commit()
+            conn.execute("VACUUM")
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        if not is_running():
+            raise sqlite3.OperationalError("interrupted")
+        shard.swap_in(build)
+    finally:
+        if os.path.exists(build): os.remove(build)
+
+def maintain(db, steps=None, is_running=lambda: True, model=None):
+    """
+    Runs the needed maintenance on all shards, one small step at a time.
+
+    Every step checks is_running() while it works, so stopping returns
+    quickly (e.g. when the user starts a search).
+
+    Args:
+        db (DatabaseHandler): The index.
+        steps (list): Force these steps on every shard (default: as needed).
+        is_running (callable): Returns False to stop between two steps.
+        model: Optional model for re-embedding documents (see repair).
+
+    Returns:
+        list: (folder, step) tuples that were run.
+    """
+    done = []
+    for shard in list(db.shards.values()):
+        if not is_running(): break
+        if not shard.exists(): continue
+        try:
+            todo = steps if steps is not None else needs_maintenance(shard_health(shard))
+            if "repair" in todo and is_running():
+                with metrics.timer("maintenance.repair"):
+                    metrics.count("maintenance.repaired_rows", repair(shard, model, is_running))
+                done.append((shard.folder_path, "repair"))
+            if "merge" in todo and is_running():
+                with metrics.timer("maintenance.merge"):
+                    while is_running() and merge_step(shard, is_running=is_running):
+                        metrics.count("maintenance.merge_steps")
+                done.append((shard.folder_path, "merge"))
+            if "vacuum" in todo and is_running():
+                with metrics.timer("maintenance.compact"):
+                    compact(shard, is_running)
+                done.append((shard.folder_path, "vacuum"))
+        except sqlite3.OperationalError:
+            # Aborted by the progress handler
+            if is_running(): raise
+            metrics.count("maintenance.interrupted")
+            break
+    for folder, step in done:
+        print(f"Maintenance: {step} {folder}")
+    return done
+
+def format_health(health):
+    """
+    Formats index_health() as plain text (for the UI).
+
+    Args:
+        health (dict): Result of index_health().
+
+    Returns:
+        str: One block per folder plus totals.
+    """
+    mb = lambda b: f"{b / 1048576:.1f} MB"
+    t = health["totals"]
+    lines = [
+        f"Dokumente: {t['docs']} · Vektoren: {t['vectors']}",
+        f"Verwaiste Vektoren: {t['orphaned_embeddings']} · Ohne Vektor: {t['missing_embeddings']}",
+        f"Größe: {mb(t['db_bytes'] + t['vector_bytes'] + t['catalog_bytes'])}",
+    ]
+    for h in health["shards"]:
+        lines.append("")
+        lines.append(h["folder"])
+        if not h["exists"]:
+            lines.append("  (noch nicht indexiert)")
+            continue
+        lines.append(f"  {h['docs']} Dokumente · {mb(h['db_bytes'])} + {mb(h['vector_bytes'])} Vektoren")
+        lines.append(f"  Fragmentierung: {h['fragmentation']:.0%} · FTS-Segmente: {h['fts_segments']}/{h['trigram_segments']}")
+    return "\n".join(lines)
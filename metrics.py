@@ -0,0 +1,134 @@
+# metrics.py
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Metrics:
+    """
+    Thread-safe per-stage timers and counters.
+
+    Recording is a perf_counter() call and a dict update under a lock,
+    cheap enough for the indexing loop and the per-shard search threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._timers = {}    # name -> [count, total_s, max_s]
+        self._counters = {}  # name -> value
+
+    @contextmanager
+    def timer(self, name):
+        """Measures the duration of the with-block under the given stage name."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def observe(self, name, seconds):
+        """Records one duration (in seconds) for a stage."""
+        with self._lock:
+            t = self._timers.get(name)
+            if t is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]: t[2] = seconds
+
+    def count(self, name, n=1):
+        """Increments a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        """Clears all timers and counters."""
+        with self._lock:
+            self._started = time.time()
+            self._timers.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        Returns a copy of all values.
+
+        Returns:
+            dict: uptime_s, timers (count, total_ms, avg_ms, max_ms per stage)
+                  and counters.
+        """
+        with self._lock:
+            timers = {
+                name: {
+                    "count": c,
+                    "total_ms": round(total * 1000, 3),
+                    "avg_ms": round(total * 1000 / c, 3),
+                    "max_ms": round(mx * 1000, 3),
+                }
+                for name, (c, total, mx) in sorted(self._timers.items())
+            }
+            counters = dict(sorted(self._counters.items()))
+            uptime = time.time() - self._started
+        return {"uptime_s": round(uptime, 1), "timers": timers, "counters": counters}
+
+    def dump(self, path):
+        """Writes the snapshot as JSON file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+def format_snapshot(snap):
+    """
+    Formats a snapshot as plain text table (for the UI).
+
+    Args:
+        snap (dict): Result of Metrics.snapshot().
+
+    Returns:
+        str: One line per timer and counter.
+    """
+    lines = [f"Laufzeit: {snap['uptime_s']:.0f} s", "", "Stufe: Anzahl / Ø ms / max ms / gesamt ms"]
+    for name, t in snap["timers"].items():
+        lines.append(f"{name}: {t['count']} / {t['avg_ms']:.1f} / {t['max_ms']:.1f} / {t['total_ms']:.0f}")
+    if snap["counters"]:
+        lines.append("")
+        for name, value in snap["counters"].items():
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+def start_http_server(port, registry=None):
+    """
+    Serves the metrics snapshot as JSON on http://127.0.0.1:<port>/metrics.
+
+    Runs in a daemon thread and only listens on localhost.
+
+    Args:
+        port (int): The TCP port.
+        registry (Metrics): The registry to export, default: the global one.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(registry.snapshot(), indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # keine Zugriffe ins Log
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="MetricsHTTP").start()
+    return server
+
+# Global registry used by indexer, shards and database
+metrics = Metrics()
@@ -0,0 +1,510 @@
+# shard.py
+import sqlite3
+import os
+import time
+import numpy as np
+from rapidfuzz import fuzz
+from config import SHARD_DIR
+from fusion import scatter_lexical, fuse
+from metrics import metrics
+
+# Max. number of candidates the typo-tolerant trigram index hands to rapidfuzz
+TRIGRAM_CANDIDATES = 100
+# Typos tolerated per word: one edit breaks at most 3 trigrams, so a word
+# with n trigrams still shares n - 3 * edits of them with the misspelling
+TRIGRAM_EDITS_SHORT = 1  # words up to TRIGRAM_SHORT_WORD characters
+TRIGRAM_EDITS_LONG = 2   # longer words (covers transpositions like "finanical")
+TRIGRAM_SHORT_WORD = 5
+# Trigrams found in more than this share of the documents are skipped ("the", "ing")
+TRIGRAM_MAX_DF = 0.2
+
+def trigram_needed(n_grams, word_len):
+    """
+    Returns the min. number of shared trigrams for a word with n_grams
+    (usable) trigrams, i.e. the q-gram count bound n - 3 * edits, at least 1.
+
+    Args:
+        n_grams (int): Number of trigrams of the word that are queried.
+        word_len (int): Length of the word, decides the tolerated edits.
+    """
+    edits = TRIGRAM_EDITS_SHORT if word_len <= TRIGRAM_SHORT_WORD else TRIGRAM_EDITS_LONG
+    return max(1, n_grams - 3 * edits)
+
+def trigram_words(query):
+    """
+    Splits every word of the query into overlapping 3-character chunks.
+
+    Args:
+        query (str): The raw search query.
+
+    Returns:
+        list: One list of distinct trigrams per word with at least 3 characters.
+    """
+    words = []
+    for word in query.lower().replace('"', '').split():
+        grams = list(dict.fromkeys(word[i:i + 3] for i in range(len(word) - 2)))
+        if grams: words.append(grams)
+    return words
+
+def file_mtime(path):
+    """
+    Returns the modification time of an indexed path.
+
+    For virtual ZIP paths ("archive.zip :: member") the archive is used.
+    Missing files yield 0.0.
+    """
+    real = path.split(" :: ")[0] if " :: " in path else path
+    try:
+        return os.path.getmtime(real)
+    except OSError:
+        return 0.0
+
+class IndexShard:
+    """
+    The search index of one folder: a SQLite file (FTS + embeddings)
+    and a vector file with the normalized embeddings and per-document
+    attributes for fast loading.
+
+    A shard is rebuilt by writing a complete new database next to the
+    old one and swapping the files (see swap_in), so other shards and
+    running searches are never locked.
+    """
+    def __init__(self, folder_id, folder_path, shard_dir=SHARD_DIR):
+        """
+        Initializes the shard handle. No files are created here.
+
+        Args:
+            folder_id (int): The ID of the folder in the catalog.
+            folder_path (str): The absolute path of the indexed folder.
+            shard_dir (str): Directory holding the shard files.
+        """
+        self.folder_id = folder_id
+        self.folder_path = folder_path
+        self.db_path = os.path.join(shard_dir, f"shard_{folder_id}.db")
+        self.vec_path = os.path.join(shard_dir, f"shard_{folder_id}.npz")
+        self._index = None
+
+    @staticmethod
+    def init_schema(conn):
+        """
+        Creates the shard tables (documents, documents_trigram, embeddings,
+        doc_meta, file_state, shard_info) if they don't already exist.
+
+        Args:
+            conn: An open connection to the shard database.
+        """
+        cursor = conn.cursor()
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(filename, path, content);")
+        # Trigram index over filename + content for typo-tolerant matching.
+        # External content: the text itself is only stored once (in documents).
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS documents_trigram USING fts5(filename, content, content='documents', tokenize='trigram');")
+        cursor.execute("CREATE TABLE IF NOT EXISTS embeddings (doc_id INTEGER PRIMARY KEY, vec BLOB);")
+        # Per-document attributes for pre-filtering (extension, mtime)
+        cursor.execute("CREATE TABLE IF NOT EXISTS doc_meta (doc_id INTEGER PRIMARY KEY, ext TEXT, mtime REAL);")
+        # Size + mtime of every scanned file, used for incremental re-indexing
+        cursor.execute("CREATE TABLE IF NOT EXISTS file_state (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);")
+        # Key/value flags of the shard (e.g. needs_catchup after a snapshot import)
+        cursor.execute("CREATE TABLE IF NOT EXISTS shard_info (key TEXT PRIMARY KEY, value TEXT);")
+        conn.commit()
+
+    @staticmethod
+    def delete_file(cursor, path):
+        """
+        Removes all documents of one file (for ZIPs: all members) from a shard.
+
+        Args:
+            cursor: A cursor on the shard database.
+            path (str): The path of the file on disk.
+        """
+        prefix = f"{path} :: "
+        where = "path = ? OR substr(path, 1, ?) = ?"
+        params = (path, len(prefix), prefix)
+        ids = [r[0] for r in cursor.execute(f"SELECT rowid FROM documents WHERE {where}", params).fetchall()]
+        if not ids:
+            return
+        # The trigram index needs the old values, so it goes first
+        cursor.execute(f"INSERT INTO documents_trigram (documents_trigram, rowid, filename, content) SELECT 'delete', rowid, filename, content FROM documents WHERE {where}", params)
+        cursor.execute(f"DELETE FROM documents WHERE {where}", params)
+        placeholders = ','.join('?' * len(ids))
+        cursor.execute(f"DELETE FROM embeddings WHERE doc_id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM doc_meta WHERE doc_id IN ({placeholders})", ids)
+
+    @staticmethod
+    def backfill_file_state(cursor):
+        """
+        Fills an empty file_state table from the indexed documents.
+
+        Shards built before file_state existed (or migrated from the old
+        single-file index) have no file states, so an incremental run would
+        index every file a second time. The stored mtime of each document
+        is used; archives get no mtime and are always re-indexed once.
+
+        Args:
+            cursor: A cursor on the shard database.
+
+        Returns:
+            int: Number of file states written (0 if the table wasn't empty).
+        """
+        if cursor.execute("SELECT 1 FROM file_state LIMIT 1").fetchone():
+            return 0
+        states = {}
+        rows = cursor.execute("SELECT d.path, m.mtime FROM documents d LEFT JOIN doc_meta m ON m.doc_id = d.rowid").fetchall()
+        for path, mtime in rows:
+            real = path.split(" :: ")[0]
+            if real != path: mtime = None
+            try:
+                size = os.path.getsize(real)
+            except OSError:
+                size = None
+            states[real] = (size, mtime)
+        cursor.executemany("INSERT INTO file_state (path, size, mtime) VALUES (?, ?, ?)",
+                           [(p, size, mtime) for p, (size, mtime) in states.items()])
+        return len(states)
+
+    @staticmethod
+    def write_vectors(conn, target):
+        """
+        Exports embeddings and attributes of a shard database into a vector file.
+
+        Args:
+            conn: An open connection to the shard database.
+            target (str): Path of the .npz file to write.
+        """
+        data = conn.execute("""
+            SELECT e.doc_id, e.vec, m.ext, m.mtime
+            FROM embeddings e LEFT JOIN doc_meta m ON m.doc_id = e.doc_id
+            ORDER BY e.doc_id
+        """).fetchall()
+        if data:
+            vecs = np.array([np.frombuffer(d[1], dtype=np.float32) for d in data])
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        else:
+            vecs = np.zeros((0, 0), dtype=np.float32)
+        with open(target, "wb") as f:
+            np.savez(f,
+                     doc_ids=np.array([d[0] for d in data], dtype=np.int64),
+                     vecs=vecs,
+                     exts=np.array([d[2] or "" for d in data], dtype=str),
+                     mtimes=np.array([d[3] or 0.0 for d in data], dtype=np.float64))
+
+    def exists(self):
+        """Returns True if the shard database exists on disk."""
+        return os.path.exists(self.db_path)
+
+    def needs_catchup(self):
+        """Returns True if the shard was imported and not yet re-checked against the disk."""
+        if not self.exists():
+            return False
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'shard_info'").fetchone():
+                return False
+            row = conn.execute("SELECT value FROM shard_info WHERE key = 'needs_catchup'").fetchone()
+        finally:
+            conn.close()
+        return bool(row)
+
+    def copy_to(self, target):
+        """
+        Writes a consistent copy of the shard database (SQLite backup API).
+
+        Args:
+            target (str): Path of the copy.
+        """
+        src = sqlite3.connect(self.db_path)
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def build_path(self):
+        """Returns the path a rebuilt shard database is written to before swap_in."""
+        return self.db_path + ".build"
+
+    def swap_in(self, build_path):
+        """
+        Replaces the shard files with a freshly built database.
+
+        Writes the vector file for the new database first, then moves
+        both files into place.
+
+        Args:
+            build_path (str): Path of the complete new shard database.
+        """
+        vec_tmp = self.vec_path + ".build"
+        conn = sqlite3.connect(build_path)
+        try:
+            self.write_vectors(conn, vec_tmp)
+        finally:
+            conn.close()
+        os.replace(build_path, self.db_path)
+        os.replace(vec_tmp, self.vec_path)
+        self._index = None
+
+    def refresh_vectors(self, conn):
+        """
+        Rewrites the vector file after the shard database was changed in place.
+
+        Args:
+            conn: An open connection to the shard database.
+        """
+        vec_tmp = self.vec_path + ".build"
+        self.write_vectors(conn, vec_tmp)
+        os.replace(vec_tmp, self.vec_path)
+        self._index = None
+
+    def drop(self):
+        """Deletes all files of the shard."""
+        for path in (self.db_path, self.vec_path, self.build_path(), self.vec_path + ".build"):
+            if os.path.exists(path):
+                os.remove(path)
+        self._index = None
+
+    def invalidate(self):
+        """Drops the in-memory vectors, they get reloaded on the next search."""
+        self._index = None
+
+    def _load_index(self):
+        """
+        Loads vectors and attributes of the shard into compact arrays.
+
+        The arrays stay in memory until the shard files change, so filtering
+        is a cheap mask operation instead of a database query.
+
+        Returns:
+            dict: doc_ids, vecs (L2-normalized), ext_codes, ext_vocab and
+                  mtimes - or None if the shard holds no embeddings.
+        """
+        if not self.exists():
+            return None
+        if not os.path.exists(self.vec_path):
+            # e.g. shard was written by an older version: create the vector file
+            conn = sqlite3.connect(self.db_path)
+            try:
+                self.write_vectors(conn, self.vec_path)
+            finally:
+                conn.close()
+
+        signature = (os.stat(self.db_path).st_mtime_ns, os.stat(self.vec_path).st_mtime_ns)
+        if self._index is not None and self._index["signature"] == signature:
+            return self._index
+
+        with np.load(self.vec_path, allow_pickle=False) as data:
+            doc_ids, vecs, exts, mtimes = data["doc_ids"], data["vecs"], data["exts"], data["mtimes"]
+        if not len(doc_ids):
+            self._index = None
+            return None
+
+        ext_vocab, ext_codes = np.unique(exts, return_inverse=True)
+        self._index = {
+            "signature": signature,
+            "doc_ids": doc_ids,
+            "vecs": vecs,
+            "ext_vocab": ext_vocab.tolist(),
+            "ext_codes": ext_codes.astype(np.uint16),
+            "mtimes": mtimes,
+        }
+        return self._index
+
+    def _filter_mask(self, index, exts, modified_after, modified_before):
+        """
+        Builds a boolean mask over the loaded index from the filters.
+
+        Returns:
+            np.ndarray: The mask, or None if no filter is active.
+        """
+        masks = []
+        if exts is not None:
+            codes = [i for i, e in enumerate(index["ext_vocab"]) if e in exts]
+            masks.append(np.isin(index["ext_codes"], codes))
+        if modified_after is not None:
+            masks.append(index["mtimes"] >= modified_after)
+        if modified_before is not None:
+            masks.append(index["mtimes"] <= modified_before)
+        if not masks:
+            return None
+        return np.logical_and.reduce(masks)
+
+    def _filter_sql(self, exts, modified_after, modified_before):
+        """
+        Builds the same filters as SQL for the FTS queries.
+
+        Returns:
+            tuple: (sql, params) - an "AND rowid IN (...)" clause or ("", []).
+        """
+        conds, params = [], []
+        if exts is not None:
+            conds.append(f"ext IN ({','.join('?' * len(exts))})")
+            params.extend(exts)
+        if modified_after is not None:
+            conds.append("mtime >= ?")
+            params.append(modified_after)
+        if modified_before is not None:
+            conds.append("mtime <= ?")
+            params.append(modified_before)
+        if not conds:
+            return "", []
+        return f" AND rowid IN (SELECT doc_id FROM doc_meta WHERE {' AND '.join(conds)})", params
+
+    def _trigram_candidates(self, cursor, query, n_docs, filter_sql="", filter_params=()):
+        """
+        Finds documents sharing most trigrams with at least one query word.
+
+        Trigrams that occur in more than TRIGRAM_MAX_DF of the documents
+        are dropped (document frequency from an fts5vocab table), so the
+        posting lists read stay short. A document qualifies for a word if
+        it shares enough of the word's remaining trigrams to be within a
+        few edits of it (see trigram_needed); candidates are ranked by the
+        summed share of matched trigrams over all words.
+
+        Args:
+            cursor: A cursor on the shard database.
+            query (str): The search query.
+            n_docs (int): Number of documents in the shard.
+            filter_sql (str): Pre-filter clause from _filter_sql().
+            filter_params (list): Parameters of filter_sql.
+
+        Returns:
+            list: Document IDs, best first, at most TRIGRAM_CANDIDATES.
+        """
+        words = trigram_words(query)
+        if not words:
+            return []
+
+        all_grams = list(dict.fromkeys(g for grams in words for g in grams))
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.trigram_vocab USING fts5vocab(main, documents_trigram, row)")
+        df = dict(cursor.execute(f"SELECT term, doc FROM temp.trigram_vocab WHERE term IN ({','.join('?' * len(all_grams))})", all_grams).fetchall())
+
+        parts, params = [], []
+        for grams in words:
+            rare = [g for g in grams if df.get(g, 0) <= max(n_docs * TRIGRAM_MAX_DF, 1)]
+            # Grams missing in the index still count for the share (typo inside the word)
+            present = [g for g in rare if df.get(g)]
+            needed = trigram_needed(len(rare), len(grams) + 2)
+            if len(present) < needed: continue
+            hits = " UNION ALL ".join([f"SELECT rowid FROM documents_trigram WHERE documents_trigram MATCH ?{filter_sql}"] * len(present))
+            parts.append(f"SELECT rowid, COUNT(*) * 1.0 / ? AS share FROM ({hits}) GROUP BY rowid HAVING COUNT(*) >= ?")
+            params.append(len(rare))
+            for g in present:
+                params.append(f'"{g}"')
+                params.extend(filter_params)
+            params.append(needed)
+        if not parts:
+            return []
+
+        sql = f"SELECT rowid FROM ({' UNION ALL '.join(parts)}) GROUP BY rowid ORDER BY SUM(share) DESC LIMIT ?"
+        return [r[0] for r in cursor.execute(sql, params + [TRIGRAM_CANDIDATES]).fetchall()]
+
+    def search(self, q_vec, query, limit=50, method="weighted", exts=None,
+               modified_after=None, modified_before=None, fusion_params=None):
+        """
+        Runs the semantic and lexical stages on this shard.
+
+        Args:
+            q_vec (np.ndarray): The L2-normalized query embedding.
+            query (str): The search query.
+            limit (int): Max. number of results of this shard.
+            method (str): Fusion scorer, "weighted" or "rrf".
+            exts (list): Only these file extensions (lowercase).
+            modified_after (float): Only files modified at/after this timestamp.
+            modified_before (float): Only files modified at/before this timestamp.
+            fusion_params (dict): Overrides for the scorer (see fusion.py).
+
+        Returns:
+            list: (score, doc_id) tuples of the shard's top-k, best first.
+        """
+        with metrics.timer("search.load_vectors"):
+            index = self._load_index()
+        if index is None:
+            return []
+
+        t0 = time.perf_counter()
+        # Pre-filter: only the remaining rows take part in the dot product
+        mask = self._filter_mask(index, exts, modified_after, modified_before)
+        doc_ids, vecs = index["doc_ids"], index["vecs"]
+        if mask is not None:
+            doc_ids, vecs = doc_ids[mask], vecs[mask]
+        if not len(doc_ids):
+            return []
+        filter_sql, filter_params = self._filter_sql(exts, modified_after, modified_before)
+
+        # 1. Cosine Similarity (vectors are normalized)
+        sem_scores = np.clip(vecs @ q_vec, 0, 1)
+        metrics.observe("search.vector_scan", time.perf_counter() - t0)
+        metrics.count("search.vectors_scanned", len(doc_ids))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+
+            # 2. Lexical Search (FTS)
+            # 2a. Exact/prefix candidates from the default index
+            t0 = time.perf_counter()
+            words = query.replace('"', '').split()
+            if not words: words = [query]
+            fts_query = " OR ".join([f'"{w}"*' for w in words])
+
+            candidates = []
+            try:
+                rows = cursor.execute(f"SELECT rowid FROM documents WHERE documents MATCH ?{filter_sql} LIMIT 100", [fts_query] + filter_params).fetchall()
+                candidates.extend(r[0] for r in rows)
+            except Exception as e:
+                print(f"FTS Error (ignored): {e}")
+
+            # 2b. Typo-tolerant candidates from the trigram index
+            try:
+                candidates.extend(self._trigram_candidates(cursor, query, len(index["doc_ids"]), filter_sql, filter_params))
+            except Exception as e:
+                print(f"Trigram FTS Error (ignored): {e}")
+
+            metrics.observe("search.fts", time.perf_counter() - t0)
+
+            # 2c. Rerank only the small candidate set with rapidfuzz
+            t0 = time.perf_counter()
+            fts_rows = []
+            candidates = list(dict.fromkeys(candidates))
+            if candidates:
+                placeholders = ','.join('?' * len(candidates))
+                try:
+                    # Truncate content for performance
+                    fts_rows = cursor.execute(f"SELECT rowid, filename, substr(content, 1, 5000) FROM documents WHERE rowid IN ({placeholders})", candidates).fetchall()
+                except Exception as e:
+                    print(f"FTS Error (ignored): {e}")
+        finally:
+            conn.close()
+
+        lex_map = {}
+        for did, fname, content in fts_rows:
+            r1 = fuzz.partial_ratio(query.lower(), fname.lower())
+            r2 = fuzz.partial_token_set_ratio(query.lower(), content.lower())
+            lex_map[did] = max(r1, r2) / 100.0
+        metrics.observe("search.fuzz", time.perf_counter() - t0)
+        metrics.count("search.fuzz_candidates", len(fts_rows))
+
+        # 3. Hybrid Fusion (vectorized, only the top-k get sorted)
+        with metrics.timer("search.fusion"):
+            lex_scores, has_lex = scatter_lexical(doc_ids, lex_map)
+            top_idx, top_scores = fuse(sem_scores, lex_scores, has_lex, k=limit, method=method, **(fusion_params or {}))
+        return list(zip(top_scores.tolist(), doc_ids[top_idx].tolist()))
+
+    def fetch(self, doc_ids):
+        """
+        Fetches filename, path and snippet for the given documents.
+
+        Args:
+            doc_ids (list): Document IDs of this shard.
+
+        Returns:
+            dict: doc_id -> (filename, path, snippet).
+        """
+        if not doc_ids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            placeholders = ','.join('?' * len(doc_ids))
+            rows = conn.execute(f"SELECT rowid, filename, path, snippet(documents, 2, '<b>', '</b>', '...', 15) FROM documents WHERE rowid IN ({placeholders})", list(doc_ids)).fetchall()
+        finally:
+            conn.close()
+        return {r[0]: r[1:] for r in rows}
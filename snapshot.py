@@ -0,0 +1,204 @@
+# snapshot.py
+import os
+import json
+import time
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+from config import MODEL_NAME
+from shard import IndexShard
+
+SNAPSHOT_FORMAT = "uff-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXT = ".uffsnap"
+
+def parse_remap(spec):
+    """
+    Parses a path remapping of the form "OLD=NEW".
+
+    Args:
+        spec (str): e.g. "\\\\server\\share=Z:\\share"
+
+    Returns:
+        tuple: (old_prefix, new_prefix)
+    """
+    if "=" not in spec:
+        raise ValueError(f"Invalid remapping (expected OLD=NEW): {spec}")
+    old, new = spec.split("=", 1)
+    return old.strip(), new.strip()
+
+def remap_path(path, remaps):
+    """
+    Rewrites the prefix of a path according to the remappings.
+
+    The separators of the remaining path follow the new prefix, so a UNC
+    path can be mapped onto a POSIX mount and vice versa. The member part
+    of virtual ZIP paths ("archive.zip :: member") is kept as is.
+
+    Args:
+        path (str): The original path.
+        remaps (list): (old_prefix, new_prefix) tuples, longest first.
+
+    Returns:
+        str: The remapped path (unchanged if no prefix matches).
+    """
+    for old, new in remaps:
+        if not path.lower().startswith(old.lower()):
+            continue
+        rest = path[len(old):]
+        # Only match whole path components ("\\srv\\share" must not match "\\srv\\share2")
+        if rest and old[-1:] not in "\\/" and rest[0] not in "\\/":
+            continue
+        member = ""
+        if " :: " in rest:
+            rest, member = rest.split(" :: ", 1)
+            member = " :: " + member
+        if "/" in new and "\\" not in new:
+            rest = rest.replace("\\", "/")
+        elif "\\" in new and "/" not in new:
+            rest = rest.replace("/", "\\")
+        return new + rest + member
+    return path
+
+def read_manifest(source):
+    """
+    Reads and validates the manifest of a snapshot file.
+
+    Args:
+        source (str): Path of the snapshot file.
+
+    Returns:
+        dict: The manifest (format, version, model, created, folders).
+    """
+    try:
+        with zipfile.ZipFile(source) as z:
+            manifest = json.loads(z.read("manifest.json").decode("utf-8"))
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ValueError(f"Not a valid snapshot: {e}")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("Not a valid snapshot: unknown format")
+    if manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {manifest.get('version')} is newer than supported ({SNAPSHOT_VERSION})")
+    if manifest.get("model") != MODEL_NAME:
+        raise ValueError(f"Snapshot was built with model {manifest.get('model')}, expected {MODEL_NAME}")
+    return manifest
+
+def export_snapshot(db, target):
+    """
+    Writes all shards of the index into one compact snapshot file.
+
+    Each shard is copied with VACUUM INTO, so the snapshot holds the FTS
+    data, the embeddings and the file states without free pages. The
+    vector files are not included, they get rebuilt from the embeddings
+    on import.
+
+    Args:
+        db (DatabaseHandler): The index to export.
+        target (str): Path of the snapshot file.
+
+    Returns:
+        int: Number of exported folders.
+    """
+    folders = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as z:
+            for shard in db.shards.values():
+                if not shard.exists(): continue
+                name = f"shard_{shard.folder_id}.db"
+                copy = os.path.join(tmp, name)
+                conn = sqlite3.connect(shard.db_path)
+                try:
+                    conn.execute("VACUUM INTO ?", (copy,))
+                finally:
+                    conn.close()
+                # Older shards have no file states, the importer needs them for the catch-up
+                conn = sqlite3.connect(copy)
+                try:
+                    IndexShard.init_schema(conn)
+                    IndexShard.backfill_file_state(conn.cursor())
+                    conn.commit()
+                finally:
+                    conn.close()
+                z.write(copy, name)
+                os.remove(copy)
+                folders.append({"path": shard.folder_path, "db": name})
+
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "model": MODEL_NAME,
+                "created": time.time(),
+                "folders": folders,
+            }
+            z.writestr("manifest.json", json.dumps(manifest, indent=2))
+    except Exception:
+        if os.path.exists(target): os.remove(target)
+        raise
+    return len(folders)
+
+def _remap_shard(conn, remaps):
+    """
+    Rewrites all stored paths of a shard database.
+
+    Args:
+        conn: An open connection to the shard database.
+        remaps (list): (old_prefix, new_prefix) tuples, longest first.
+    """
+    cursor = conn.cursor()
+    updates = []
+    for did, path in cursor.execute("SELECT rowid, path FROM documents").fetchall():
+        new = remap_path(path, remaps)
+        if new != path: updates.append((new, did))
+    # path is not part of the trigram index, so documents_trigram stays valid
+    cursor.executemany("UPDATE documents SET path = ? WHERE rowid = ?", updates)
+
+    states = cursor.execute("SELECT path, size, mtime FROM file_state").fetchall()
+    cursor.execute("DELETE FROM file_state")
+    cursor.executemany("INSERT OR REPLACE INTO file_state (path, size, mtime) VALUES (?, ?, ?)",
+                       [(remap_path(p, remaps), size, mtime) for p, size, mtime in states])
+
+def import_snapshot(db, source, remaps=None):
+    """
+    Imports a snapshot: every folder of the snapshot replaces the local shard.
+
+    The imported shards are marked with needs_catchup, so the next
+    (incremental) indexer run only processes files that changed since
+    the snapshot was taken.
+
+    Args:
+        db (DatabaseHandler): The local index.
+        source (str): Path of the snapshot file.
+        remaps (list): Optional (old_prefix, new_prefix) tuples for the paths.
+
+    Returns:
+        list: The (remapped) folder paths that were imported.
+    """
+    manifest = read_manifest(source)
+    remaps = sorted(remaps or [], key=lambda r: len(r[0]), reverse=True)
+    imported = []
+    with zipfile.ZipFile(source) as z:
+        names = set(z.namelist())
+        for entry in manifest["folders"]:
+            if entry.get("db") not in names:
+                raise ValueError(f"Snapshot is incomplete: {entry.get('db')} missing")
+            folder = remap_path(entry["path"], remaps)
+            db.add_folder(folder)
+            shard = db.get_shard(folder)
+
+            build = shard.build_path()
+            if os.path.exists(build): os.remove(build)
+            with z.open(entry["db"]) as src, open(build, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+            conn = sqlite3.connect(build)
+            try:
+                IndexShard.init_schema(conn)
+                if remaps: _remap_shard(conn, remaps)
+                conn.execute("INSERT OR REPLACE INTO shard_info (key, value) VALUES ('needs_catchup', '1')")
+                conn.commit()
+            finally:
+                conn.close()
+            shard.swap_in(build)
+            imported.append(folder)
+    return imported
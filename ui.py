@@ -1,17 +1,22 @@
 # ui.py
 import os
+import time
+from datetime import datetime
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLineEdit, QPushButton, QLabel, QFileDialog, 
                              QProgressBar, QMessageBox, QListWidget, QListWidgetItem, 
                              QSplitter, QFrame, QScrollArea, QStyle, QGraphicsDropShadowEffect,
-                             QSplashScreen) # QSplashScreen hier wichtig
-from PyQt6.QtCore import Qt, QUrl, QThread, pyqtSignal, QRect
+                             QSplashScreen, QComboBox, QInputDialog) # QSplashScreen hier wichtig
+from PyQt6.QtCore import Qt, QUrl, QThread, pyqtSignal, QRect, QTimer
 from PyQt6.QtGui import QDesktopServices, QColor, QFont, QPainter, QIcon, QPixmap # Painter & Icon neu
 from sentence_transformers import SentenceTransformer
 
 from database import DatabaseHandler
-from indexer import IndexerThread
-from config import STYLESHEET
+from indexer import IndexerThread, TEXT_EXTENSIONS
+from config import STYLESHEET, MODEL_NAME
+from metrics import metrics, format_snapshot
+from maintenance import maintain, index_health, format_health
+from snapshot import SNAPSHOT_EXT, export_snapshot, import_snapshot, read_manifest, parse_remap
 
 # --- NEU: Ein moderner Splash Screen mit Ladebalken ---
 class ModernSplashScreen(QSplashScreen):
@@ -65,11 +70,49 @@ class ModelLoaderThread(QThread):
     def run(self):
         try:
             # Das ist der schwere Teil, der dauert
-            model = SentenceTransformer('all-MiniLM-L6-v2')
+            model = SentenceTransformer(MODEL_NAME)
             self.model_loaded.emit(model)
         except: 
             self.model_loaded.emit(None)
 
+# --- Thread für die Index-Wartung im Leerlauf ---
+class MaintenanceThread(QThread):
+    finished_signal = pyqtSignal(int)
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.is_running = True
+
+    def stop(self):
+        self.is_running = False
+
+    def run(self):
+        try:
+            done = maintain(self.db, is_running=lambda: self.is_running, model=self.db.model)
+        except Exception as e:
+            print(f"Maintenance failed: {e}")
+            done = []
+        self.finished_signal.emit(len(done))
+
+# --- Thread für Snapshot Export/Import (kann bei Netzlaufwerken Minuten dauern) ---
+class SnapshotThread(QThread):
+    finished_signal = pyqtSignal(object, str) # Ergebnis, Fehlermeldung ("" = ok)
+
+    def __init__(self, func, *args):
+        super().__init__()
+        self.func = func
+        self.args = args
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            print(f"Snapshot failed: {e}")
+            self.finished_signal.emit(None, str(e) or type(e).__name__)
+            return
+        self.finished_signal.emit(result, "")
+
 # --- SearchResultItem (Unverändert, aber der Vollständigkeit halber hier) ---
 class SearchResultItem(QFrame):
     def __init__(self, filename, filepath, snippet, parent=None):
@@ -126,11 +169,34 @@ class SearchResultItem(QFrame):
         target = self.filepath.split(" :: ")[0] if " :: " in self.filepath else self.filepath
         QDesktopServices.openUrl(QUrl.fromLocalFile(target))
 
+# --- Filter-Optionen ---
+TYPE_FILTERS = [
+    ("Alle Dateitypen", None),
+    ("PDF", [".pdf"]),
+    ("Word", [".docx"]),
+    ("Excel", [".xlsx"]),
+    ("PowerPoint", [".pptx"]),
+    ("Text & Code", TEXT_EXTENSIONS),
+]
+
+DATE_FILTERS = ["Beliebiges Datum", "Letzte 7 Tage", "Letzte 30 Tage", "Dieses Jahr"]
+
+# Wartung (Merge, Vacuum, Reparatur) erst nach so langer Untätigkeit
+IDLE_MAINTENANCE_MS = 2 * 60 * 1000
+
 # --- Das Hauptfenster ---
 class UffWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.db = DatabaseHandler()
+        self.idx_thread = None
+        self.idx_queue = [] # (folder, incremental) - wartet auf den laufenden Scan
+        self.maint_thread = None
+        self.snap_thread = None
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(IDLE_MAINTENANCE_MS)
+        self.idle_timer.timeout.connect(self.run_maintenance)
         self.initUI()
         
        
@@ -164,16 +230,31 @@ class UffWindow(QMainWindow):
         btn_add.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogNewFolder))
         btn_add.clicked.connect(self.add_new_folder)
         
-        btn_del = QPushButton(" Ordner entfernen")
-        btn_del.setObjectName("SidebarBtn")
-        btn_del.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_TrashIcon))
-        btn_del.clicked.connect(self.delete_selected_folder)
+        self.btn_del = QPushButton(" Ordner entfernen")
+        self.btn_del.setObjectName("SidebarBtn")
+        self.btn_del.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_TrashIcon))
+        self.btn_del.clicked.connect(self.delete_selected_folder)
         
         self.btn_rescan = QPushButton(" Neu scannen")
         self.btn_rescan.setObjectName("SidebarBtn")
         self.btn_rescan.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload))
         self.btn_rescan.clicked.connect(self.rescan)
         
+        self.btn_export = QPushButton(" Index exportieren")
+        self.btn_export.setObjectName("SidebarBtn")
+        self.btn_export.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogSaveButton))
+        self.btn_export.clicked.connect(self.export_index)
+
+        self.btn_import = QPushButton(" Index importieren")
+        self.btn_import.setObjectName("SidebarBtn")
+        self.btn_import.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogOpenButton))
+        self.btn_import.clicked.connect(self.import_index)
+        
+        btn_stats = QPushButton(" Statistik")
+        btn_stats.setObjectName("SidebarBtn")
+        btn_stats.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogInfoView))
+        btn_stats.clicked.connect(self.show_metrics)
+        
         self.btn_cancel = QPushButton("STOPPEN")
         self.btn_cancel.setObjectName("CancelBtn")
         self.btn_cancel.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogCancelButton))
@@ -185,8 +266,11 @@ class UffWindow(QMainWindow):
         left.addWidget(self.folder_list)
         left.addSpacing(10)
         left.addWidget(btn_add)
-        left.addWidget(btn_del)
+        left.addWidget(self.btn_del)
         left.addWidget(self.btn_rescan)
+        left.addWidget(self.btn_export)
+        left.addWidget(self.btn_import)
+        left.addWidget(btn_stats)
         left.addWidget(self.btn_cancel)
 
         # -- MAIN AREA --
@@ -209,6 +293,20 @@ class UffWindow(QMainWindow):
         search_box.addWidget(self.input)
         search_box.addWidget(self.btn_go)
 
+        # -- FILTER --
+        filter_box = QHBoxLayout()
+        self.cmb_type = QComboBox()
+        for label, exts in TYPE_FILTERS:
+            self.cmb_type.addItem(label, exts)
+        self.cmb_folder = QComboBox()
+        self.cmb_date = QComboBox()
+        self.cmb_date.addItems(DATE_FILTERS)
+
+        filter_box.addWidget(self.cmb_type)
+        filter_box.addWidget(self.cmb_folder)
+        filter_box.addWidget(self.cmb_date)
+        filter_box.addStretch()
+
         status_box = QHBoxLayout()
         self.lbl_status = QLabel("Bereit.")
         self.lbl_status.setObjectName("StatusLabel")
@@ -227,17 +325,44 @@ class UffWindow(QMainWindow):
         self.scroll.setWidget(self.res_cont)
 
         right.addLayout(search_box)
+        right.addLayout(filter_box)
         right.addLayout(status_box)
         right.addWidget(self.scroll)
 
         main_layout.addWidget(left_panel)
         main_layout.addWidget(right_panel)
         self.set_ui_enabled(False)
+        self.set_folders_enabled(False)
 
     def set_ui_enabled(self, enabled):
         self.input.setEnabled(enabled)
         self.btn_go.setEnabled(enabled)
+        self.cmb_type.setEnabled(enabled)
+        self.cmb_folder.setEnabled(enabled)
+        self.cmb_date.setEnabled(enabled)
+
+    def set_folders_enabled(self, enabled):
+        # Während eines Scans bleibt die Suche frei, gesperrt ist nur, was die
+        # Shard-Dateien des Indexers anfasst. (Hinzufügen wird eingereiht.)
         self.folder_list.setEnabled(enabled)
+        self.btn_del.setEnabled(enabled)
+        self.btn_export.setEnabled(enabled)
+        self.btn_import.setEnabled(enabled)
+
+    def current_filters(self):
+        """Liest die Filter-Auswahl als Argumente für DatabaseHandler.search."""
+        filters = {"exts": self.cmb_type.currentData()}
+        if folder := self.cmb_folder.currentData():
+            filters["folders"] = [folder]
+
+        date_idx = self.cmb_date.currentIndex()
+        if date_idx == 1:
+            filters["modified_after"] = time.time() - 7 * 86400
+        elif date_idx == 2:
+            filters["modified_after"] = time.time() - 30 * 86400
+        elif date_idx == 3:
+            filters["modified_after"] = datetime(datetime.now().year, 1, 1).timestamp()
+        return filters
     
     # Methoden für Model Loading (wird jetzt von main gesteuert)
     def on_model_loaded(self, model):
@@ -247,6 +372,11 @@ class UffWindow(QMainWindow):
         self.db.model = model
         self.lbl_status.setText("Bereit für deine Suche.")
         self.set_ui_enabled(True)
+        self.set_folders_enabled(True)
+        self.idle_timer.start()
+        # Importierte Snapshots (z.B. per Kommandozeile) auf den aktuellen Stand bringen
+        for shard in self.db.shards.values():
+            if shard.needs_catchup(): self.start_idx(shard.folder_path, incremental=True)
 
     # ... RESTLICHE METHODEN (search, add_folder etc.) bleiben gleich wie vorher ...
     # (Kopiere hier einfach die Methoden aus deiner alten ui.py rein, 
@@ -262,7 +392,10 @@ class UffWindow(QMainWindow):
             child = self.res_layout.takeAt(0)
             if child.widget(): child.widget().deleteLater()
 
-        results = self.db.search(query)
+        # Wartung pausieren (bricht sofort ab), nach der nächsten Ruhephase geht es weiter
+        self.stop_maintenance()
+        self.idle_timer.start()
+        results = self.db.search(query, **self.current_filters())
         self.lbl_status.setText(f"{len(results)} Treffer gefunden.")
 
         if not results:
@@ -277,10 +410,13 @@ class UffWindow(QMainWindow):
 
     def load_saved_folders(self):
         self.folder_list.clear()
+        self.cmb_folder.clear()
+        self.cmb_folder.addItem("Alle Ordner", None)
         for f in self.db.get_folders():
             item = QListWidgetItem(self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon), f)
             item.setToolTip(f)
             self.folder_list.addItem(item)
+            self.cmb_folder.addItem(os.path.basename(f) or f, f)
 
     def add_new_folder(self):
         f = QFileDialog.getExistingDirectory(self, "Ordner wählen")
@@ -291,26 +427,136 @@ class UffWindow(QMainWindow):
     def delete_selected_folder(self):
         item = self.folder_list.currentItem()
         if item and QMessageBox.question(self, "Löschen", f"Weg damit?\n{item.text()}", QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-            self.db.remove_folder(item.text())
+            self.stop_maintenance()
+            folder = item.text()
+            self.idx_queue = [job for job in self.idx_queue if job[0] != folder]
+            if self.idx_thread and self.idx_thread.folder_path == folder:
+                # Scan dieses Ordners abbrechen, bevor seine Dateien gelöscht werden.
+                # idx_done räumt danach wie gewohnt auf.
+                self.idx_thread.stop()
+                self.idx_thread.wait()
+            self.db.remove_folder(folder)
             self.load_saved_folders()
 
     def rescan(self):
         if item := self.folder_list.currentItem(): self.start_idx(item.text())
 
-    def start_idx(self, folder):
+    def show_metrics(self):
+        text = format_health(index_health(self.db)) + "\n\n" + format_snapshot(metrics.snapshot())
+        QMessageBox.information(self, "Statistik", text)
+
+    def run_maintenance(self):
+        # Nur wenn nichts anderes läuft
+        if self.idx_thread or self.snap_thread or self.maint_thread or not self.db.model: return
+        self.maint_thread = MaintenanceThread(self.db)
+        self.maint_thread.finished_signal.connect(self.maintenance_done)
+        self.maint_thread.start()
+
+    def stop_maintenance(self):
+        self.idle_timer.stop()
+        if self.maint_thread:
+            self.maint_thread.stop()
+            self.maint_thread.wait()
+            self.maint_thread = None
+
+    def maintenance_done(self, n):
+        # Signal eines schon gestoppten Threads ignorieren
+        if self.sender() is not self.maint_thread: return
+        self.maint_thread.wait()
+        self.maint_thread = None
+        if n: self.db.invalidate()
+
+    def export_index(self):
+        if self.idx_thread or self.snap_thread: return
+        f, _ = QFileDialog.getSaveFileName(self, "Index exportieren", f"uff_index{SNAPSHOT_EXT}", f"UFF Snapshot (*{SNAPSHOT_EXT})")
+        if not f: return
+        self.start_snapshot("Exportiere Index...", self.export_done, export_snapshot, self.db, f)
+
+    def export_done(self, n, error):
+        self.snapshot_finished()
+        if error:
+            QMessageBox.critical(self, "Fehler", f"Export fehlgeschlagen:\n{error}")
+            return
+        self.lbl_status.setText(f"Index exportiert: {n} Ordner.")
+
+    def import_index(self):
+        if self.idx_thread or self.snap_thread: return
+        f, _ = QFileDialog.getOpenFileName(self, "Index importieren", "", f"UFF Snapshot (*{SNAPSHOT_EXT})")
+        if not f: return
+        try:
+            manifest = read_manifest(f)
+            folders = "\n".join(e["path"] for e in manifest["folders"])
+            spec, ok = QInputDialog.getText(self, "Pfade umschreiben",
+                f"Ordner im Snapshot:\n{folders}\n\nPfade umschreiben (ALT=NEU, mehrere mit ; trennen, leer = keine):")
+            if not ok: return
+            remaps = [parse_remap(r) for r in spec.split(";") if r.strip()]
+        except Exception as e:
+            print(f"Snapshot import failed: {e}")
+            QMessageBox.critical(self, "Fehler", f"Import fehlgeschlagen:\n{e}")
+            return
+        self.start_snapshot("Importiere Index...", self.import_done, import_snapshot, self.db, f, remaps)
+
+    def import_done(self, imported, error):
+        self.snapshot_finished()
+        self.load_saved_folders()
+        if error:
+            QMessageBox.critical(self, "Fehler", f"Import fehlgeschlagen:\n{error}")
+            return
+        self.lbl_status.setText(f"Index importiert: {len(imported)} Ordner.")
+        # Nur Änderungen seit dem Snapshot nachindexieren
+        for folder in imported:
+            self.start_idx(folder, incremental=True)
+
+    def start_snapshot(self, text, done, func, *args):
+        # Wartung könnte sonst einen Shard mitten im Export austauschen
+        self.stop_maintenance()
+        self.set_folders_enabled(False)
+        self.lbl_status.setText(text)
+        self.prog.setRange(0, 0); self.prog.show() # Laufbalken ohne Prozent
+        self.snap_thread = SnapshotThread(func, *args)
+        self.snap_thread.finished_signal.connect(done)
+        self.snap_thread.start()
+
+    def snapshot_finished(self):
+        self.snap_thread.wait()
+        self.snap_thread = None
+        self.db.invalidate()
+        self.prog.hide()
+        self.set_folders_enabled(True)
+        # Während des Snapshots eingereihte Scans starten
+        if self.idx_queue:
+            self.start_idx(*self.idx_queue.pop(0))
+        else:
+            self.idle_timer.start()
+
+    def start_idx(self, folder, incremental=False):
         if not self.db.model: return
-        self.set_ui_enabled(False)
+        if self.idx_thread or self.snap_thread:
+            self.idx_queue.append((folder, incremental))
+            return
+        self.stop_maintenance()
+        self.set_folders_enabled(False)
         self.btn_cancel.show(); self.btn_rescan.hide(); self.prog.show()
-        self.idx_thread = IndexerThread(folder, self.db.db_name, self.db.model)
+        self.prog.setRange(0, 100); self.prog.setValue(0)
+        self.idx_thread = IndexerThread(self.db.get_shard(folder), self.db.model, incremental)
         self.idx_thread.progress_signal.connect(self.lbl_status.setText)
+        self.idx_thread.percent_signal.connect(self.prog.setValue)
         self.idx_thread.finished_signal.connect(self.idx_done)
         self.idx_thread.start()
 
     def cancel_idx(self):
+        self.idx_queue.clear()
         if self.idx_thread: self.idx_thread.stop()
 
     def idx_done(self, n, s, c):
-        self.set_ui_enabled(True)
+        self.idx_thread.wait() # run() ist schon durch, nur aufräumen
+        self.idx_thread = None
+        self.db.invalidate()
+        self.set_folders_enabled(True)
         self.btn_cancel.hide(); self.btn_rescan.show(); self.prog.hide()
         msg = "Abgebrochen" if c else "Indexierung fertig"
-        self.lbl_status.setText(f"{msg}: {n} neu, {s} übersprungen.")
\ No newline at end of file
+        self.lbl_status.setText(f"{msg}: {n} neu, {s} übersprungen.")
+        if self.idx_queue:
+            self.start_idx(*self.idx_queue.pop(0))
+        else:
+            self.idle_timer.start()